@@ -7,22 +7,110 @@ This script is designed to scan folder of choice and move to target folders.
 This looks for commonly used extensions.
 
 Usage:
-    - Adjust the source_dir folder to match your target folder(Downloads or Documents is common)
+    - Adjust SOURCE_DIR to match your target folder(Downloads or Documents is common), or pass --source
     - Run the script to automatically organize and archive old files.
+    - Pass --days to change the age threshold and --mapping to load your own mappings from a JSON file.
+    - Other scripts can import this module and call main() directly.
 
 Notes:
     - A log file will be created in a directory one level up
 """
 
+import argparse
 import datetime
+import errno
+import json
 import logging
+import logging.handlers
 import os
+import re
 import socket
 import sys
 import shutil
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
+# Resolved once at import, the default source and destination directories are built from it
+HOME = Path.home()
+
+# Default age in days a file must reach before it is moved
+DEFAULT_DAYS_THRESHOLD = 7
+
+# Add any type of extensions here.
+FILE_TYPE_MAPPING = {
+    "3d": [".3mf", ".stl"],
+    "docs": [".doc", ".docx", ".json", ".log", ".odt", ".pdf", ".txt"],
+    "ebooks": [".epub", ".mobi"],
+    "excel": [".csv", ".xls", ".xlsm", ".xlsx"],
+    "images": [
+        ".jpg", ".jpeg", ".jpe", ".jif", ".jfif", ".jfi", ".png", ".gif", ".webp", ".tiff", ".tif",
+        ".psd", ".raw", ".arw", ".cr2", ".nrw", ".k25", ".bmp", ".dib", ".heif", ".heic", ".ind",
+        ".indd", ".indt", ".jp2", ".j2k", ".jpf", ".jpx", ".jpm", ".mj2", ".svg", ".svgz", ".ai",
+        ".eps", ".ico",
+    ],
+    "powerbi": [".pbids", ".pbit", ".pbix", ".potx", ".rdl", ".rdlc", ".rsix", ".pbitx", 
+                ".pbix.d", ".pbitm", ".pbix.tmp", ".pbit.tmp", ".pbix.asdatabase", ".pbix.aspkg",
+                ".pbix.aspac", ".pbix.asrepo", ".pbix.asperational", ".pbix.layout", ".pbiviz", ".rsds"],
+    "powerpoint": [".ppt", ".pptx"],
+    "program": [".AppImage", ".apk", ".exe", ".msi"],
+    "python": [".ipynb", ".py"],
+    "sql": [".sql"],
+    "videos": [".webm", ".mpg", ".mp2", ".mpeg", ".mpe", ".mpv", ".ogg", ".mp4", ".mp4v", ".m4v",
+            ".avi", ".wmv", ".mov", ".qt", ".flv", ".swf", ".avchd"],
+    "web": [".htm", ".html"],
+    "zips": [".7z", ".deb", ".gz", ".rar", ".tar", ".tar.xy", ".tar.xz", ".tgz", ".zip"]
+}
+
+# Destination directories. Set to each user defaults, adjust as appropriate.
+DEST_DIRS = {
+    "three_d": HOME / "Documents/3dPrints",
+    "docs": HOME / "Documents/Docs",
+    "ebooks": HOME / "Documents/eBooks",
+    "excel": HOME / "Documents/Excel",
+    "images": HOME / "Pictures",
+    "powerbi": HOME / "Documents/PowerBI",
+    "powerpoint": HOME / "Documents/Powerpoint",
+    "programs": HOME / "Documents/Programs",
+    "python": HOME / "Documents/Python",
+    "sql": HOME / "Documents/SQL",
+    "videos": HOME / "Videos",
+    "web": HOME / "Documents/Web",
+    "zips": HOME / "Documents/Zip"
+}
+
+# Source Directory, where you'd like this to start.
+SOURCE_DIR = HOME / "Downloads"
+
+# Number of threads used to copy files across to destinations on other devices
+MAX_MOVE_WORKERS = 8
+
+# Last number make_unique handed out for each (destination, stem, suffix).
+# Cleared at the start of every check_files_in_dir call so each scan starts fresh.
+_unique_counter_cache = {}
+
+# Device id of each directory seen so far, so each one is only stat'ed once per scan.
+# Cleared alongside _unique_counter_cache.
+_device_cache = {}
+
+
+def get_device(directory: str) -> int:
+    """
+    Look up the id of the device a directory lives on, caching the result.
+
+    Args:
+        directory (str): The path to the directory.
+
+    Returns:
+        int: The st_dev of the directory.
+    """
+    directory = str(directory)
+    device = _device_cache.get(directory)
+    if device is None:
+        device = _device_cache[directory] = os.stat(directory).st_dev
+    return device
+
 
 def make_unique(destination: str, name: str) -> str:
     """
@@ -37,19 +125,41 @@ def make_unique(destination: str, name: str) -> str:
 
     Example:
         If a file named "example.txt" already exists in the destination directory, the function will return a unique filename like "example(1).txt".
+        If copies are missing from the middle of the numbering, a number after the existing copies may be used instead of the gap.
     """
-    destination_path = Path(destination)
-    base_name = destination_path / name
-    if not base_name.exists():
+    if not os.path.lexists(os.path.join(destination, name)):
         return name
-    stem = base_name.stem
-    suffix = base_name.suffix
+    stem, suffix = os.path.splitext(name)
 
-    counter = 1
-    # If file exists, adds a number to the end of the filename
-    while (destination_path / f"{stem}({counter}){suffix}").exists():
-        counter += 1
-    return f"{stem}({counter}){suffix}"
+    def numbered_exists(counter: int) -> bool:
+        return os.path.lexists(os.path.join(destination, f"{stem}({counter}){suffix}"))
+
+    # If file exists, adds a number to the end of the filename.
+    # Start past the last number handed out for this name during the current scan (if a file
+    # was actually moved to it), then double the step until a free name is found and binary
+    # search back to the end of the numbered run, so k existing copies cost O(log k) checks
+    # instead of k.
+    # Assumes the copies are numbered without gaps, which is how this function creates them.
+    # Gaps left by deleted copies are not filled: with copies 1, 2, 3, 5, 6, 7 this may return
+    # 8 rather than 4. The name is still guaranteed not to exist.
+    cache_key = (destination, stem, suffix)
+    low = _unique_counter_cache.get(cache_key, 0)
+    if low and not numbered_exists(low):
+        low = 0
+    step = 1
+    high = low + step
+    while numbered_exists(high):
+        low = high
+        step *= 2
+        high = low + step
+    while high - low > 1:
+        middle = (low + high) // 2
+        if numbered_exists(middle):
+            low = middle
+        else:
+            high = middle
+    _unique_counter_cache[cache_key] = high
+    return f"{stem}({high}){suffix}"
 
 
 def move_file(source: str, destination: str, name: str) -> None:
@@ -67,70 +177,217 @@ def move_file(source: str, destination: str, name: str) -> None:
     Notes:
         - If a file with the same name already exists in the destination directory,
           a unique name is generated using the `make_unique` function.
-        - The file is then moved to the destination directory.
+        - The file is then moved to the destination directory with `os.replace`, falling back
+          to `shutil.move` (copy and delete) when the rename crosses filesystems.
         - A log entry is created indicating the file movement.
     """
-    if os.path.isfile(f"{destination}/{name}"):
-        unique_name = make_unique(destination, name)
-        dest_name = os.path.join(destination, unique_name)
-    else:
-        dest_name = os.path.join(destination, name)
-    print(source, dest_name)
-    shutil.move(source, dest_name)
-    logging.info(f"Moved: {name} to {str(dest_name)}")
+    dest_name = os.path.join(destination, make_unique(destination, name))
+    try:
+        os.replace(source, dest_name)
+    except OSError as e:
+        # Renames can't cross filesystems, even between bind mounts that report the same st_dev
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(source, dest_name)
+    logging.info("Moved: %s to %s", name, dest_name)
+
 
+def build_extension_lookup(file_type_mapping: dict, dest_dirs: dict) -> tuple:
+    """
+    Flatten the file type mappings into lookups from extension to destination directory.
+
+    Args:
+    - file_type_mapping (dict): File types mapped to their list of extensions.
+    - dest_dirs (dict): File types mapped to their destination directory.
 
-def check_files_in_dir(base_folder: str, days_threshold: int) -> None:
+    Returns:
+    - tuple: The lowercased extension -> destination dict, and a compiled pattern matching the
+      multi-dot extensions (e.g. .tar.xz) that can't be found from the last suffix alone,
+      or None if there are none.
+    """
+    ext_to_dest = {}
+    compound_extensions = []
+    for file_type, extensions in file_type_mapping.items():
+        destination_folder = dest_dirs.get(file_type)
+        if not destination_folder:
+            continue
+        # Kept as a string so moves only deal with os.path string joins
+        destination_folder = str(destination_folder)
+        for extension in extensions:
+            # Stored lowercased, matched against the lowercased file name
+            extension = extension.lower()
+            ext_to_dest.setdefault(extension, destination_folder)
+            if extension.count(".") > 1:
+                compound_extensions.append(extension)
+    compound_pattern = None
+    if compound_extensions:
+        compound_pattern = re.compile(
+            "(?:" + "|".join(re.escape(extension) for extension in compound_extensions) + ")$"
+        )
+    return ext_to_dest, compound_pattern
+
+
+def move_files(destination: str, sources: list) -> None:
+    """
+    Moves a batch of files into one destination directory, one after another.
+
+    Args:
+        destination (str): The path to the destination directory.
+        sources (list): (source path, file name) pairs to move into the destination.
+
+    Returns:
+        None: The function does not return any value.
+
+    Notes:
+        - Each destination is only ever handled by one batch at a time, so `make_unique`
+          can't race with another thread picking a name in the same directory.
+    """
+    for source, name in sources:
+        move_file(source, destination, name)
+
+
+def load_mapping(mapping_path: str = None) -> tuple:
+    """
+    Load the file type mappings and destination directories, falling back to the defaults above.
+
+    Args:
+    - mapping_path (str): Optional path to a JSON file with "file_type_mapping" and/or "dest_dirs"
+      objects. Any section left out keeps its default. Destination paths may start with ~, and
+      extensions written without their leading dot (e.g. "pdf") have it added.
+
+    Returns:
+    - tuple: The file type mapping dict and the destination directories dict.
+    """
+    file_type_mapping = FILE_TYPE_MAPPING
+    dest_dirs = DEST_DIRS
+    if mapping_path:
+        with open(mapping_path, encoding="utf-8") as mapping_file:
+            config = json.load(mapping_file)
+        if "file_type_mapping" in config:
+            # Extensions are matched as file name suffixes, so they need their leading dot
+            file_type_mapping = {
+                file_type: [
+                    extension if extension.startswith(".") else f".{extension}"
+                    for extension in extensions
+                ]
+                for file_type, extensions in config["file_type_mapping"].items()
+            }
+        if "dest_dirs" in config:
+            dest_dirs = {
+                file_type: Path(os.path.expanduser(folder))
+                for file_type, folder in config["dest_dirs"].items()
+            }
+    return file_type_mapping, dest_dirs
+
+
+def candidate_files(base_folder: str):
+    """
+    Yield the regular files directly inside base_folder.
+
+    Args:
+    - base_folder (str): The base folder path.
+
+    Yields:
+    - os.DirEntry: Each file in the folder, sub-directories are skipped.
+    """
+    # The with block closes the directory handle as soon as the scan finishes
+    with os.scandir(base_folder) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield entry
+
+
+def check_files_in_dir(base_folder: str, days_threshold: int, ext_to_dest: dict, compound_pattern=None) -> None:
     """
     Move files in the base_folder to their respective destination folders based on their extensions
     if they are older than the specified days_threshold.
 
     Args:
     - base_folder (str): The base folder path.
-    - days_threshold (int): The threshold in days for the age of the files.
+    - days_threshold (int): The threshold in days for the age of the files. A file is moved once it is
+      more than days_threshold * 24 hours old, and 0 or less moves every mapped file.
+    - ext_to_dest (dict): Lowercased extensions mapped to destination folders, from `build_extension_lookup`.
+    - compound_pattern (re.Pattern): Pattern for multi-dot extensions, from `build_extension_lookup`.
 
     Returns:
     - None
     """
-    # Get current date
-    current_date = datetime.now()
-    
+    # Caches only hold for one scan, files and mounts may change between calls
+    _unique_counter_cache.clear()
+    _device_cache.clear()
+
+    # Files last touched before this timestamp are old enough to move.
+    # With no threshold every file is old enough, so the age check (and its stat) is skipped.
+    check_age = days_threshold > 0
+    cutoff = time.time() - days_threshold * 86400
+
+    # Files to move, grouped by destination folder
+    pending_moves = {}
+
     # Iterate over files in base_folder
-    for files in os.scandir(base_folder):
-        if files.is_file():
-            name = files.name
-            # Iterate over file type mappings
-            for file_type, extensions in file_type_mapping.items():
-                # Check if the file extension matches any in the current mapping setups
-                for extension in extensions:
-                    if name.endswith(extension) or name.endswith(extension.upper()):
-                        # Get the destination folder
-                        destination_folder = dest_dirs.get(file_type)
-                        if destination_folder:
-                            # Move the file to the appropriate destination directory if it's old enough
-                            try:  # Accounting for files with no modifications, and only a create time
-                                modification_time = datetime.fromtimestamp(
-                                    os.path.getmtime(files)
-                                )
-                                # Calculate the difference between current date and modification time
-                                difference = current_date - modification_time
-                            except:
-                                creation_time = datetime.fromtimestamp(
-                                    os.path.getctime(files)
-                                )
-                                # Calculate the difference between current date and creation time
-                                difference = current_date - creation_time
-                            # Move the file if it's over threshold
-                            if difference.days > days_threshold:
-                                os.makedirs(destination_folder, exist_ok=True)
-                                source_path = Path(files)
-                                move_file(source_path, destination_folder, files.name)
-                                break  # No need to continue checking extensions once moved
+    for files in candidate_files(base_folder):
+        name_lower = files.name.lower()
+        # Look up the destination folder from the file extension
+        suffix = name_lower[name_lower.rfind("."):]
+        destination_folder = ext_to_dest.get(suffix)
+        if destination_folder is None and compound_pattern:
+            match = compound_pattern.search(name_lower)
+            if match:
+                destination_folder = ext_to_dest[match.group()]
+        # Unmapped files are skipped before any further work, including the stat for the age check
+        if destination_folder is None:
+            continue
+        # Move the file to the appropriate destination directory if it's old enough
+        if check_age:
+            # DirEntry.stat() is cached on the entry, so this is at most one stat call per file
+            file_stat = files.stat()
+            # Accounting for files with no modifications, and only a create time
+            file_time = file_stat.st_mtime or file_stat.st_ctime
+            # Skip the file if it's under threshold
+            if file_time >= cutoff:
+                continue
+        # DirEntry.path is already a plain string, no need to build a Path per file
+        pending_moves.setdefault(destination_folder, []).append((files.path, files.name))
 
+    # Moves on the same filesystem are a cheap rename, so only moves that have to copy
+    # across devices are handed to worker threads, one destination per task.
+    source_device = get_device(base_folder)
+    local_moves = {}
+    remote_moves = {}
+    for destination_folder, sources in pending_moves.items():
+        # Only destinations that actually receive files are created, once each
+        os.makedirs(destination_folder, exist_ok=True)
+        if get_device(destination_folder) == source_device:
+            local_moves[destination_folder] = sources
+        else:
+            remote_moves[destination_folder] = sources
 
-if __name__ == "__main__":
-    ## Setting up Audit Log
-    ## Used for troubleshooting
+    if remote_moves:
+        with ThreadPoolExecutor(max_workers=MAX_MOVE_WORKERS) as executor:
+            futures = [
+                executor.submit(move_files, destination_folder, sources)
+                for destination_folder, sources in remote_moves.items()
+            ]
+            for destination_folder, sources in local_moves.items():
+                move_files(destination_folder, sources)
+            # Surface any errors raised while moving
+            for future in futures:
+                future.result()
+    else:
+        for destination_folder, sources in local_moves.items():
+            move_files(destination_folder, sources)
+
+
+def setup_logging() -> None:
+    """
+    Set up the audit log, used for troubleshooting.
+
+    Returns:
+    - None
+
+    Notes:
+    - The log file is named after this script and today's date.
+    """
     full_script_name = os.path.basename(__file__)
     script_name = full_script_name[: full_script_name.rindex(".")]
     now = datetime.now()  # current date and time
@@ -139,61 +396,67 @@ if __name__ == "__main__":
     # Change .parent.parent to .parent to keep in the same directory.
     os.makedirs(log_path, exist_ok=True)
     log_file = os.path.join(log_path, log_name)
+    file_handler = logging.FileHandler(log_file)
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    )
+    # Buffer records and write them to the log file in batches of 100
+    # (errors and the end of the run flush straight away)
+    memory_handler = logging.handlers.MemoryHandler(capacity=100, target=file_handler)
     logging.basicConfig(
-        filename=log_file,
         level=logging.DEBUG,
-        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[memory_handler],
     )
     logging.disable(logging.DEBUG)
-    # local_machine_running = socket.gethostname()
-    days_threshold = 7
-
-    # Add any type of extensions here.
-    file_type_mapping = {
-        "3d": [".3mf", ".stl"],
-        "docs": [".doc", ".docx", ".json", ".log", ".odt", ".pdf", ".txt"],
-        "ebooks": [".epub", ".mobi"],
-        "excel": [".csv", ".xls", ".xlsm", ".xlsx"],
-        "images": [
-            ".jpg", ".jpeg", ".jpe", ".jif", ".jfif", ".jfi", ".png", ".gif", ".webp", ".tiff", ".tif",
-            ".psd", ".raw", ".arw", ".cr2", ".nrw", ".k25", ".bmp", ".dib", ".heif", ".heic", ".ind",
-            ".indd", ".indt", ".jp2", ".j2k", ".jpf", ".jpx", ".jpm", ".mj2", ".svg", ".svgz", ".ai",
-            ".eps", ".ico",
-        ],
-        "powerbi": [".pbids", ".pbit", ".pbix", ".potx", ".rdl", ".rdlc", ".rsix", ".pbitx", 
-                    ".pbix.d", ".pbitm", ".pbix.tmp", ".pbit.tmp", ".pbix.asdatabase", ".pbix.aspkg",
-                    ".pbix.aspac", ".pbix.asrepo", ".pbix.asperational", ".pbix.layout", ".pbiviz", ".rsds"],
-        "powerpoint": [".ppt", ".pptx"],
-        "program": [".AppImage", ".apk", ".exe", ".msi"],
-        "python": [".ipynb", ".py"],
-        "sql": [".sql"],
-        "videos": [".webm", ".mpg", ".mp2", ".mpeg", ".mpe", ".mpv", ".ogg", ".mp4", ".mp4v", ".m4v",
-                ".avi", ".wmv", ".mov", ".qt", ".flv", ".swf", ".avchd"],
-        "web": [".htm", ".html"],
-        "zips": [".7z", ".deb", ".gz", ".rar", ".tar", ".tar.xy", ".tar.xz", ".tgz", ".zip"]
-    }
-
-    # Destination directories. Set to each user defaults, adjust as appropriate.
-    dest_dirs = {
-        "three_d": Path.home() / "Documents/3dPrints",
-        "docs": Path.home() / "Documents/Docs",
-        "ebooks": Path.home() / "Documents/eBooks",
-        "excel": Path.home() / "Documents/Excel",
-        "images": Path.home() / "Pictures",
-        "powerbi": Path.home() / "Documents/PowerBI",
-        "powerpoint": Path.home() / "Documents/Powerpoint",
-        "programs": Path.home() / "Documents/Programs",
-        "python": Path.home() / "Documents/Python",
-        "sql": Path.home() / "Documents/SQL",
-        "videos": Path.home() / "Videos",
-        "web": Path.home() / "Documents/Web",
-        "zips": Path.home() / "Documents/Zip"
-    }
-
-    # Source Directory, where you'd like this to start.
-    source_dir = Path.home() / "Downloads"    
-
-    check_files_in_dir(source_dir, days_threshold)
+
+
+def main(source_dir: str = SOURCE_DIR, days_threshold: int = DEFAULT_DAYS_THRESHOLD, mapping_path: str = None) -> None:
+    """
+    Sort the files in source_dir into their destination folders.
+
+    Args:
+    - source_dir (str): The folder to clean up.
+    - days_threshold (int): The threshold in days for the age of the files.
+    - mapping_path (str): Optional JSON file overriding the file type mappings and destination directories.
+
+    Returns:
+    - None
+    """
+    file_type_mapping, dest_dirs = load_mapping(mapping_path)
+
+    # Built once up front so the per-file loop only does dict lookups
+    ext_to_dest, compound_pattern = build_extension_lookup(file_type_mapping, dest_dirs)
+
+    check_files_in_dir(source_dir, days_threshold, ext_to_dest, compound_pattern)
     logging.info(
-        "Cleaned up log files older than a week and placed them in the appropriate folder."
-    )
\ No newline at end of file
+        "Cleaned up files older than %s days and placed them in the appropriate folder.",
+        days_threshold,
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+    - argparse.Namespace: The source folder, age threshold and optional mapping file.
+    """
+    parser = argparse.ArgumentParser(description="Move old files into folders based on their extensions.")
+    parser.add_argument(
+        "--source", default=SOURCE_DIR, help="Folder to clean up (default: %(default)s)"
+    )
+    parser.add_argument(
+        "--days", type=int, default=DEFAULT_DAYS_THRESHOLD,
+        help="Only move files older than this many days, 0 moves everything (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mapping", help="JSON file overriding the file type mappings and destination directories"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging()
+    # local_machine_running = socket.gethostname()
+    main(args.source, args.days, args.mapping)